@@ -0,0 +1,46 @@
+"""Disk memo cache for API-Football metadata endpoints.
+
+Rounds and fixtures for past rounds never change, so every script that
+needs them can share one cached copy instead of re-hitting /fixtures and
+/fixtures/rounds per run. Entries live under ~/.cache/football-insights
+keyed by a hash of the function name and arguments.
+"""
+import hashlib
+import os
+import time
+from functools import wraps
+from pathlib import Path
+
+import orjson
+
+CACHE_DIR = Path(os.getenv("FOOTBALL_CACHE_DIR", str(Path.home() / ".cache" / "football-insights")))
+
+
+def disk_cached(ttl: float = 86400.0):
+    """Memoize a JSON-returning function on disk for ttl seconds.
+
+    Use the default day-long ttl for immutable past-round data and a short
+    one (e.g. 60) for anything tracking the in-progress round. The cache is
+    best-effort: any read/write problem falls through to the network.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = orjson.dumps([fn.__name__, args, kwargs], option=orjson.OPT_SORT_KEYS)
+            path = CACHE_DIR / f"{hashlib.sha1(key).hexdigest()}.json"
+            try:
+                if path.exists() and (time.time() - path.stat().st_mtime) < ttl:
+                    return orjson.loads(path.read_bytes())
+            except Exception:
+                pass
+            result = fn(*args, **kwargs)
+            try:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".tmp")
+                tmp.write_bytes(orjson.dumps(result))
+                os.replace(tmp, path)
+            except Exception:
+                pass
+            return result
+        return wrapper
+    return decorator
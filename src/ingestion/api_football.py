@@ -1,25 +1,111 @@
-import os, time, requests
+import os, time, threading, orjson, requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ._cache import CACHE_DIR
 
 BASE = "https://v3.football.api-sports.io"
 
-def _headers():
-    return {"x-apisports-key": os.environ["API_FOOTBALL_KEY"]}
+# One keep-alive session for the whole run: reuses the TCP+TLS connection to
+# the API host instead of handshaking on every call. The sqlite-backed cache
+# answers repeat lookups locally (or via a cheap 304 revalidation) — past
+# rounds never change, so a second invocation costs no quota. It lives in
+# the shared cache dir, not the CWD, so it can't land inside the repo.
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+SESSION = requests_cache.CachedSession(
+    str(CACHE_DIR / "api_cache.sqlite"),
+    expire_after=3600,
+    cache_control=True,
+    allowable_codes=(200, 304),
+)
+def _api_key_auth(req):
+    # resolved per request, not at import: importing this module (e.g. for
+    # paged_get) must not require API_FOOTBALL_KEY to be set yet
+    req.headers["x-apisports-key"] = os.environ["API_FOOTBALL_KEY"]
+    return req
+
+SESSION.auth = _api_key_auth
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    ),
+)
+
+class RateLimiter:
+    """Paces calls to at most one per min_interval seconds, and slows down
+    further when the API reports its per-minute quota is nearly spent."""
+
+    def __init__(self, min_interval=0.25):
+        self.min_interval = min_interval
+        self.last_ts = None
+        self._lock = threading.Lock()
 
-def get(path, params):
+    def wait(self):
+        # reserve the next slot under the lock, sleep outside it, so threads
+        # sharing one limiter still pace the aggregate rate correctly
+        with self._lock:
+            now = time.monotonic()
+            if self.last_ts is None:
+                self.last_ts = now
+                return
+            slot = max(now, self.last_ts + self.min_interval)
+            pause = slot - now
+            self.last_ts = slot
+        if pause > 0:
+            time.sleep(pause)
+
+    def throttle_from_headers(self, headers):
+        remaining = headers.get("x-ratelimit-requests-remaining")
+        try:
+            if remaining is not None and int(remaining) < 2:
+                self.min_interval = max(self.min_interval, 6.5)  # ~10 req/min
+        except ValueError:
+            pass
+
+DEFAULT_LIMITER = RateLimiter(float(os.getenv("MIN_INTERVAL_SECONDS", "0.25")))
+
+def _fetch(path, params, limiter=None):
     url = f"{BASE}/{path}"
-    r = requests.get(url, headers=_headers(), params=params, timeout=30)
+    r = SESSION.get(url, params=params, timeout=30)
+    # cache hits replay the quota headers captured when the entry was
+    # stored; feeding a stale near-exhausted snapshot into the limiter
+    # would ratchet min_interval up for the rest of the process
+    from_cache = getattr(r, "from_cache", False)
+    if limiter is not None and not from_cache:
+        limiter.throttle_from_headers(r.headers)
     r.raise_for_status()
-    return r.json()
+    # parse the raw bytes with orjson: skips the UTF-8 decode pass and is
+    # several times faster than stdlib json on these nested payloads
+    return orjson.loads(r.content), from_cache
+
+def get(path, params, limiter=None):
+    return _fetch(path, params, limiter=limiter)[0]
 
-def paged_get(path, params, data_key="response"):
+def paged_get(path, params, data_key="response", limiter=DEFAULT_LIMITER):
     page = 1
-    while True:
+    total_pages = None
+    from_cache = False
+    while total_pages is None or page <= total_pages:
+        # no pacing between pages served from the local cache — only real
+        # network requests count against the API's per-minute budget
+        if not from_cache:
+            limiter.wait()
         payload = {**params, "page": page}
-        data = get(path, payload)
+        data, from_cache = _fetch(path, payload, limiter=limiter)
+        # paging.total tells us the last page up front, so we never issue a
+        # speculative fetch just to see an empty response
+        paging = data.get("paging") or {}
+        total_pages = paging.get("total") or 1
         items = data.get(data_key, [])
         if not items:
             break
         for it in items:
             yield it
-        time.sleep(0.25)
         page += 1
@@ -1,9 +1,30 @@
 import os, json
-from .api_football import get
+import simdjson
+from .api_football import BASE, SESSION
+
+# Lazy simdjson parsing: diagnostics only print a handful of fields, so we
+# materialize just those leaves instead of the whole payload tree.
+
+def fetch(path, params):
+    r = SESSION.get(f"{BASE}/{path}", params=params, timeout=30)
+    r.raise_for_status()
+    # one parser per call: simdjson refuses to re-parse while proxies from a
+    # previous parse are still alive, and main() holds each root across
+    # fetches. The proxy keeps its parser alive, so this is safe and still
+    # one-copy-free per payload.
+    return simdjson.Parser().parse(r.content)
+
+def _native(v):
+    """Materialize a simdjson proxy (or pass a plain value through)."""
+    if isinstance(v, simdjson.Object):
+        return v.as_dict()
+    if isinstance(v, simdjson.Array):
+        return v.as_list()
+    return v
 
 def dump_meta(name, data):
     print(f"\n## META: {name}")
-    meta = {k: data.get(k) for k in ("errors", "results", "paging")}
+    meta = {k: _native(data.get(k)) for k in ("errors", "results", "paging")}
     print(json.dumps(meta, indent=2))
 
 def main():
@@ -14,27 +35,28 @@ def main():
     print(f"LEAGUE_ID={league} SEASON={season} ROUND_NAME='{round_name}'")
 
     # 1) Confirm the round exists for this season (optional)
-    rounds = get("fixtures/rounds", {"league": league, "season": season})
+    rounds = fetch("fixtures/rounds", {"league": league, "season": season})
     dump_meta("fixtures/rounds", rounds)
-    print("First 3 rounds:", (rounds.get("response") or [])[:3])
+    first_rounds = _native(rounds.get("response")) or []
+    print("First 3 rounds:", first_rounds[:3])
 
     # 2) Fetch fixtures for exactly that round — single call (no paging)
-    fx = get("fixtures", {"league": league, "season": season, "round": round_name})
+    fx = fetch("fixtures", {"league": league, "season": season, "round": round_name})
     dump_meta("fixtures", fx)
 
     resp = fx.get("response") or []
     print(f"fixtures.response length = {len(resp)}")
 
-    if resp:
+    if len(resp):
         sample = resp[0]
         # print a minimal, schema-agnostic peek to avoid KeyErrors
         skinny = {
-            "fixture_id": sample.get("fixture", {}).get("id"),
-            "date": sample.get("fixture", {}).get("date"),
-            "status": sample.get("fixture", {}).get("status", {}).get("short"),
-            "home": sample.get("teams", {}).get("home", {}).get("name"),
-            "away": sample.get("teams", {}).get("away", {}).get("name"),
-            "goals": sample.get("goals"),
+            "fixture_id": (sample.get("fixture") or {}).get("id"),
+            "date": (sample.get("fixture") or {}).get("date"),
+            "status": ((sample.get("fixture") or {}).get("status") or {}).get("short"),
+            "home": ((sample.get("teams") or {}).get("home") or {}).get("name"),
+            "away": ((sample.get("teams") or {}).get("away") or {}).get("name"),
+            "goals": _native(sample.get("goals")),
         }
         print("\nFirst fixture (skinny):")
         print(json.dumps(skinny, indent=2))
@@ -1,14 +1,22 @@
 # etl_round.py
+import io
 import os
+import gzip
 import json
-import math
+import shutil
+import hashlib
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from typing import List, Dict
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
-import numpy as np
+import polars as pl
 from pathlib import Path
 
 # ========= Env =========
@@ -16,9 +24,35 @@ SUPABASE_URL = os.environ["SUPABASE_URL"]
 SUPABASE_SERVICE_ROLE = os.environ["SUPABASE_SERVICE_ROLE"]
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "api-football-raw")
 
+# ========= HTTP session (keep-alive) =========
+# All calls here hit the same Supabase host; a pooled session avoids a fresh
+# TCP+TLS handshake per object download / upsert chunk.
+SESSION = requests.Session()
+SESSION.headers.update({"Authorization": f"Bearer {SUPABASE_SERVICE_ROLE}"})
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    ),
+)
+
 SEASON = os.getenv("SEASON", "2023")
 ROUND = os.getenv("ROUND", "Regular Season - 1")
 
+# Large batches amortize HTTP + PostgREST overhead; tune down only if the
+# server starts rejecting payloads (413) or hitting statement timeouts.
+UPSERT_CHUNK = int(os.getenv("UPSERT_CHUNK", "5000"))
+
+# Per-fixture downloads are independent and I/O-bound; keep workers below
+# the session's pool_maxsize so threads don't block on a free connection.
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "16"))
+
 # Build the storage prefix used by the ingestion step
 PREFIX = f"{SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}"
 PLAYERS_PREFIX = f"{PREFIX}/players_by_fixture"
@@ -27,52 +61,77 @@ PLAYERS_PREFIX = f"{PREFIX}/players_by_fixture"
 def now_iso() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
+# One timestamp per ETL run: every row in a batch gets the same
+# second-resolution value anyway, so don't re-format it per fixture.
+FETCH_TS = now_iso()
+
 def _sb_list(prefix_path: str) -> List[Dict]:
     """
     List objects under a prefix in Supabase Storage (REST).
     Returns a list of dicts with at least 'name'.
     """
     url = f"{SUPABASE_URL}/storage/v1/object/list/{urllib.parse.quote(SUPABASE_BUCKET)}"
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE}",
-        "Content-Type": "application/json",
-    }
     payload = {"prefix": prefix_path, "limit": 1000}
-    r = requests.post(url, headers=headers, json=payload, timeout=60)
+    r = SESSION.post(url, json=payload, timeout=60)
     r.raise_for_status()
     data = r.json()
     return data or []
 
+# ---- ETag disk cache for Storage downloads ----
+# Storage returns an ETag per object; conditional GETs turn re-runs over an
+# unchanged round into cheap 304s instead of full downloads.
+CACHE_DIR = Path(__file__).resolve().parent / "raw-data" / "cache"
+CACHE_INDEX = CACHE_DIR / "cache_index.json"
+
+def _load_cache_index() -> Dict:
+    if CACHE_INDEX.exists():
+        try:
+            return json.loads(CACHE_INDEX.read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+    return {}
+
+_cache_index = _load_cache_index()
+_cache_lock = threading.Lock()  # _sb_get runs from worker threads
+
+def _save_cache_index():
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    CACHE_INDEX.write_text(json.dumps(_cache_index), encoding="utf-8")
+
 def _sb_get(object_key: str) -> bytes:
     """
-    Download a single object from Supabase Storage (REST).
+    Download a single object from Supabase Storage (REST), revalidating a
+    local disk cache with If-None-Match so unchanged objects cost a 304.
     """
     url = f"{SUPABASE_URL}/storage/v1/object/{urllib.parse.quote(SUPABASE_BUCKET)}/{urllib.parse.quote(object_key)}"
-    headers = {"Authorization": f"Bearer {SUPABASE_SERVICE_ROLE}"}
-    r = requests.get(url, headers=headers, timeout=120)
-    r.raise_for_status()
-    return r.content
-
-def json_safe(obj):
-    """Recursively convert pandas/NumPy/float edge cases to JSON-safe Python types."""
-    if obj is pd.NA:
-        return None
-    if isinstance(obj, (np.integer,)):
-        return int(obj)
-    if isinstance(obj, (np.floating,)):
-        f = float(obj)
-        return f if math.isfinite(f) else None
-    if isinstance(obj, float):
-        return obj if math.isfinite(obj) else None
-    if isinstance(obj, pd.Timestamp):
-        return obj.to_pydatetime().isoformat()
-    if isinstance(obj, list):
-        return [json_safe(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: json_safe(v) for k, v in obj.items()}
-    return obj
-
-def upsert_rows(table: str, rows: List[Dict], conflict: str = "fixture_id,player_id", chunk_size: int = 500):
+    headers = {}
+    entry = _cache_index.get(object_key)
+    if entry and (CACHE_DIR / entry["file"]).exists():
+        headers["If-None-Match"] = entry["etag"]
+    # Stream chunks straight to disk so the body is never buffered whole
+    # inside requests — matters with 16 download workers on small runners.
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fname = f"{hashlib.sha1(object_key.encode('utf-8')).hexdigest()}.json"
+    tmp = CACHE_DIR / (fname + ".tmp")
+    with SESSION.get(url, headers=headers, timeout=120, stream=True) as r:
+        if r.status_code == 304:
+            return (CACHE_DIR / entry["file"]).read_bytes()
+        r.raise_for_status()
+        etag = r.headers.get("ETag")
+        r.raw.decode_content = True  # transparently undo transfer encoding
+        with tmp.open("wb") as f:
+            shutil.copyfileobj(r.raw, f, length=1 << 16)
+    if etag:
+        os.replace(tmp, CACHE_DIR / fname)
+        with _cache_lock:
+            _cache_index[object_key] = {"etag": etag, "file": fname}
+            _save_cache_index()
+        return (CACHE_DIR / fname).read_bytes()
+    data = tmp.read_bytes()
+    tmp.unlink(missing_ok=True)
+    return data
+
+def upsert_rows(table: str, rows: List[Dict], conflict: str = "fixture_id,player_id", chunk_size: int = UPSERT_CHUNK):
     """
     Minimal, dependency-light upsert into Supabase Postgres using PostgREST.
     """
@@ -82,68 +141,158 @@ def upsert_rows(table: str, rows: List[Dict], conflict: str = "fixture_id,player
     url = f"{SUPABASE_URL}/rest/v1/{table}"
     headers = {
         "apikey": SUPABASE_SERVICE_ROLE,
-        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE}",
-        "Content-Type": "application/json",
-        "Prefer": "resolution=merge-duplicates,return=minimal",
+        "Prefer": "resolution=merge-duplicates,return=minimal,count=none",
     }
     params = {"on_conflict": conflict}
 
     print(f"🔼 Upserting {len(rows)} rows into '{table}' (chunk_size={chunk_size})")
+    # Rows are expected to be JSON-safe already (nulls normalized in the
+    # DataFrame layer); orjson additionally emits null for any stray NaN/Inf.
     for i in range(0, len(rows), chunk_size):
         chunk = rows[i:i+chunk_size]
-        chunk = [json_safe(rec) for rec in chunk]  # sanitize NaN/Inf/<NA> etc.
-        r = requests.post(url, headers=headers, params=params, json=chunk, timeout=120)
+        # orjson encodes straight to bytes, bypassing requests' stdlib encoder
+        r = SESSION.post(
+            url,
+            headers={**headers, "Content-Type": "application/json"},
+            params=params,
+            data=orjson.dumps(chunk),
+            timeout=120,
+        )
         if r.status_code not in (200, 201, 204):
             raise RuntimeError(f"Upsert failed [{r.status_code}]: {r.text[:400]}")
     print("✅ Upsert complete.")
 
 # ========= Transform =========
-def parse_players_json(blob: bytes) -> List[Dict]:
+def parse_players_json(blob: bytes) -> pd.DataFrame:
     """
-    Parse one players_<fixture_id>.json file to rows.
+    Parse one players_<fixture_id>.json file to a DataFrame.
     """
-    j = json.loads(blob.decode("utf-8"))
-    response = j.get("response", []) or []
-    out = []
-    for team_block in response:
-        team = team_block.get("team", {}) or {}
-        team_id = team.get("id")
-        team_name = team.get("name")
-        players = team_block.get("players", []) or []
-        for p in players:
-            player = p.get("player", {}) or {}
-            player_id = player.get("id")
-            player_name = player.get("name")
-            stats_list = p.get("statistics", []) or []
-            stats = stats_list[0] if stats_list else {}
-            games = (stats.get("games") or {})
-            goals = (stats.get("goals") or {})
-
-            rating_val = games.get("rating")
-            try:
-                rating_val = float(rating_val) if rating_val not in (None, "", "NaN") else None
-                if rating_val is not None and not math.isfinite(rating_val):
-                    rating_val = None
-            except Exception:
-                rating_val = None
-
-            row = {
-                "season": int(SEASON),
-                "round_text": ROUND,
-                "team_id": team_id,
-                "team_name": team_name,
-                "player_id": player_id,
-                "player_name": player_name,
-                "position": games.get("position"),
-                "minutes": games.get("minutes"),
-                "rating": rating_val,
-                "goals": goals.get("total"),
-                "assists": goals.get("assists"),
-                "fetched_datetime": now_iso(),
-                # fixture_id will be attached by caller
-            }
-            out.append(row)
-    return out
+    j = orjson.loads(blob)
+    return players_response_to_df(j.get("response", []) or [])
+
+def players_response_to_df(response: List[Dict]) -> pd.DataFrame:
+    """
+    Flatten one fixture's players response to a DataFrame.
+
+    Flattening is vectorized: json_normalize explodes team->players in C,
+    and the nested statistics fields are pulled out column-wise instead of
+    per-row .get() chains. fixture_id is attached by the caller.
+    """
+    # record_path raises KeyError on a team block without a players key;
+    # the API occasionally emits those, so drop them up front
+    response = [blk for blk in response if blk.get("players")]
+    if not response:
+        return pd.DataFrame()
+
+    df = pd.json_normalize(response, record_path=["players"], meta=[["team", "id"], ["team", "name"]])
+
+    def _nested(series: pd.Series, key: str) -> pd.Series:
+        # .str.get needs an object column holding at least one real dict;
+        # a fixture where every statistics list is empty flattens to an
+        # all-NaN float64 column, and the accessor would abort the ETL
+        if series.dtype == object and series.notna().any():
+            return series.str.get(key)
+        return pd.Series([None] * len(series), index=series.index, dtype=object)
+
+    if "statistics" in df.columns and df["statistics"].dtype == object:
+        stats = df["statistics"].str[0]
+    else:
+        stats = pd.Series([None] * len(df), index=df.index, dtype=object)
+    games = _nested(stats, "games")
+    goals = _nested(stats, "goals")
+
+    return pd.DataFrame({
+        "season": int(SEASON),
+        "round_text": ROUND,
+        "team_id": df["team.id"],
+        "team_name": df["team.name"],
+        "player_id": df["player.id"],
+        "player_name": df["player.name"],
+        "position": _nested(games, "position"),
+        "minutes": _nested(games, "minutes"),
+        "rating": pd.to_numeric(_nested(games, "rating"), errors="coerce"),
+        "goals": _nested(goals, "total"),
+        "assists": _nested(goals, "assists"),
+        "fetched_datetime": FETCH_TS,
+    })
+
+def _db_fixture_freshness() -> Dict[int, str]:
+    """
+    Latest fetched_datetime per fixture already upserted for this
+    season/round. Lets reruns skip fixtures whose Storage object hasn't
+    changed since the last load. (The schema has no updated_at column;
+    fetched_datetime is the load stamp.)
+    """
+    url = f"{SUPABASE_URL}/rest/v1/player_round_data"
+    params = {
+        "select": "fixture_id,fetched_datetime",
+        "season": f"eq.{SEASON}",
+        "round_text": f"eq.{ROUND}",
+    }
+    r = SESSION.get(url, headers={"apikey": SUPABASE_SERVICE_ROLE}, params=params, timeout=60)
+    r.raise_for_status()
+    freshness: Dict[int, str] = {}
+    for rec in r.json():
+        fid, ts = rec.get("fixture_id"), rec.get("fetched_datetime")
+        if fid is not None and ts and ts > freshness.get(fid, ""):
+            freshness[fid] = ts
+    return freshness
+
+def shard_to_df(shard: bytes) -> pl.DataFrame:
+    """
+    Flatten a decompressed players.ndjson.gz shard to the target schema
+    entirely inside Polars: read_ndjson lands the lines in Arrow columns,
+    and the team->players->statistics nesting is unwound with
+    explode/struct.field — no Python-level iteration over payloads.
+    """
+    raw = pl.read_ndjson(io.BytesIO(shard))
+    if raw.is_empty():
+        return pl.DataFrame()
+    try:
+        return _flatten_shard(raw)
+    except (pl.exceptions.StructFieldNotFoundError, pl.exceptions.SchemaError):
+        # a shard where every fixture has "response": [] (round not played
+        # yet) or where no block carries players/statistics infers a schema
+        # without those struct fields; treat it like the pandas paths do
+        # and fall through to the "nothing to upsert" exit
+        return pl.DataFrame()
+
+def _flatten_shard(raw: pl.DataFrame) -> pl.DataFrame:
+    return (
+        raw.select(
+            pl.col("fixture_id"),
+            pl.col("payload").struct.field("response").alias("response"),
+        )
+        .explode("response")
+        .drop_nulls("response")
+        .select(
+            pl.col("fixture_id"),
+            pl.col("response").struct.field("team").struct.field("id").alias("team_id"),
+            pl.col("response").struct.field("team").struct.field("name").alias("team_name"),
+            pl.col("response").struct.field("players").alias("players"),
+        )
+        .explode("players")
+        .drop_nulls("players")
+        .select(
+            pl.lit(int(SEASON)).alias("season"),
+            pl.lit(ROUND).alias("round_text"),
+            pl.col("team_id"),
+            pl.col("team_name"),
+            pl.col("players").struct.field("player").struct.field("id").alias("player_id"),
+            pl.col("players").struct.field("player").struct.field("name").alias("player_name"),
+            pl.col("players").struct.field("statistics").list.first().alias("stats"),
+            pl.lit(FETCH_TS).alias("fetched_datetime"),
+            pl.col("fixture_id"),
+        )
+        .with_columns(
+            pl.col("stats").struct.field("games").struct.field("position").alias("position"),
+            pl.col("stats").struct.field("games").struct.field("minutes").alias("minutes"),
+            pl.col("stats").struct.field("games").struct.field("rating").alias("rating"),
+            pl.col("stats").struct.field("goals").struct.field("total").alias("goals"),
+            pl.col("stats").struct.field("goals").struct.field("assists").alias("assists"),
+        )
+        .drop("stats")
+    )
 
 def main():
     print(f"🔎 Reading Storage prefix: {PLAYERS_PREFIX}")
@@ -160,60 +309,113 @@ def main():
         else:
             raise
 
-    # 2) List per-fixture files
-    listing = _sb_list(PLAYERS_PREFIX)
-    fixture_files = [item["name"] for item in listing if item.get("name", "").endswith(".json")]
-    print(f"🧾 Found {len(fixture_files)} players_*.json")
+    # 2) Prefer the single NDJSON shard (one GET for the whole round);
+    # fall back to listing per-fixture files for rounds fetched before
+    # the shard existed.
+    shard = None
+    try:
+        shard = gzip.decompress(_sb_get(f"{PREFIX}/players.ndjson.gz"))
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            print("players.ndjson.gz not found; falling back to per-fixture files.")
+        else:
+            raise
 
-    rows_all: List[Dict] = []
-    for fname in fixture_files:
-        # Extract fixture_id from "players_<fixture_id>.json"
+    if shard is not None:
+        df = shard_to_df(shard)
+    else:
+        dfs: List[pd.DataFrame] = []
+        listing = _sb_list(PLAYERS_PREFIX)
+        files = {
+            item["name"]: item.get("updated_at") or ""
+            for item in listing
+            if item.get("name", "").endswith(".json")
+        }
+        print(f"🧾 Found {len(files)} players_*.json")
+
+        # Incremental: skip fixtures whose Storage object is no newer than
+        # what's already loaded for this season/round.
         try:
-            fixture_id = int(fname.split("_", 1)[1].split(".json")[0])
-        except Exception:
-            print(f"⚠️ Skipping unexpected file name: {fname}")
-            continue
+            db_fresh = _db_fixture_freshness()
+        except Exception as e:
+            print(f"⚠️ Could not read DB freshness ({e}); processing everything.")
+            db_fresh = {}
+
+        # Extract fixture_id from "players_<fixture_id>.json"
+        targets = []  # (fixture_id, fname)
+        unchanged = 0
+        for fname, storage_ts in files.items():
+            try:
+                fixture_id = int(fname.split("_", 1)[1].split(".json")[0])
+            except Exception:
+                print(f"⚠️ Skipping unexpected file name: {fname}")
+                continue
+            db_ts = db_fresh.get(fixture_id)
+            if db_ts and storage_ts and storage_ts <= db_ts:
+                unchanged += 1
+                continue
+            targets.append((fixture_id, fname))
+        if unchanged:
+            print(f"⏭️ Skipping {unchanged} fixtures already up to date in the DB")
+
+        # Downloads are independent and latency-bound: fan them out over a
+        # thread pool sharing the pooled session, parse as each completes.
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as ex:
+            futures = {
+                ex.submit(_sb_get, f"{PLAYERS_PREFIX}/{fname}"): fixture_id
+                for fixture_id, fname in targets
+            }
+            for fut in as_completed(futures):
+                fixture_id = futures[fut]
+                fdf = parse_players_json(fut.result())
+                if fdf.empty:
+                    continue
+                fdf["fixture_id"] = fixture_id
+                dfs.append(fdf)
 
-        blob = _sb_get(f"{PLAYERS_PREFIX}/{fname}")
-        rows = parse_players_json(blob)
-        for r in rows:
-            r["fixture_id"] = fixture_id
-        rows_all.extend(rows)
+        if not dfs:
+            print("⚠️ No rows parsed; nothing to upsert.")
+            return
+        df = pl.concat([pl.from_pandas(f) for f in dfs], how="vertical_relaxed")
 
-    print(f"🧮 Total rows parsed: {len(rows_all)}")
+    print(f"🧮 Total rows parsed: {df.height}")
 
-    if not rows_all:
+    if df.is_empty():
         print("⚠️ No rows parsed; nothing to upsert.")
         return
 
-    # 3) Pandas normalization (light)
-    df = pd.DataFrame(rows_all)
+    # 3) Polars normalization — casts and filters run in parallel Rust over
+    # Arrow buffers instead of per-cell Python objects
 
-    # Normalize numerics (keep nullable Int64, sanitize later in json_safe)
-    for col in ("minutes", "goals", "assists", "team_id", "player_id", "fixture_id"):
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+    # Normalize numerics (non-castable values become nulls)
+    int_cols = [c for c in ("minutes", "goals", "assists", "team_id", "player_id", "fixture_id") if c in df.columns]
+    df = df.with_columns([pl.col(c).cast(pl.Int64, strict=False) for c in int_cols])
 
     if "rating" in df.columns:
-        df["rating"] = pd.to_numeric(df["rating"], errors="coerce")  # float with NaN allowed
+        # single vectorized pass: coerce and null out NaN/Inf ratings
+        df = df.with_columns(
+            pl.when(pl.col("rating").cast(pl.Float64, strict=False).is_finite())
+            .then(pl.col("rating").cast(pl.Float64, strict=False))
+            .otherwise(None)
+            .alias("rating")
+        )
 
     # Optional: enforce PK by dropping rows with null player_id
     if "player_id" in df.columns:
-        before = len(df)
-        df = df[df["player_id"].notna()]
-        dropped = before - len(df)
+        before = df.height
+        df = df.filter(pl.col("player_id").is_not_null())
+        dropped = before - df.height
         if dropped:
             print(f"⚠️ Dropped {dropped} rows with null player_id to satisfy PK")
 
     print("🧪 Sample:")
     print(df.head(5))
 
-    # 4) Upsert
+    # 4) Upsert (Polars nulls come out of to_dicts as plain None)
     upsert_rows(
         table="player_round_data",
-        rows=df.to_dict(orient="records"),
+        rows=df.to_dicts(),
         conflict="fixture_id,player_id",
-        chunk_size=500,
     )
 
 if __name__ == "__main__":
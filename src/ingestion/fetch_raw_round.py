@@ -1,8 +1,20 @@
 import os, sys, json, time
+import random
+import gzip
+import atexit
+import threading
+import orjson
+import asyncio
+import aiohttp
+import aiofiles
+import httpx
+from aiolimiter import AsyncLimiter
 from pathlib import Path
 from datetime import datetime, timezone
 import urllib.parse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ===== Env/config =====
 API_KEY  = os.getenv("API_FOOTBALL_KEY")
@@ -14,6 +26,13 @@ ROUND     = os.getenv("ROUND", "Regular Season - 1")
 MAX_ATTEMPTS_PER_FIXTURE = int(os.getenv("MAX_ATTEMPTS", 3))
 MIN_INTERVAL_SECONDS = float(os.getenv("MIN_INTERVAL_SECONDS", 6.5))  # 10 req/min -> ~6.5s safe
 
+# async fan-out (set ASYNC=0 to fall back to the serial loop)
+ASYNC_MODE = os.getenv("ASYNC", "1") != "0"
+CONCURRENCY = int(os.getenv("CONCURRENCY", 8))
+
+# multi-fixture batching (plan-dependent; probed once per run)
+FIXTURE_BATCH = int(os.getenv("FIXTURE_BATCH", 10))
+
 # Supabase Storage (RENAMED KEY)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE = os.getenv("SUPABASE_SERVICE_ROLE")  # <<< renamed
@@ -28,14 +47,46 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE:
 
 # ===== Constants/paths =====
 BASE = "https://v3.football.api-sports.io"
-HEADERS = {"x-apisports-key": API_KEY}
+
+# Shared keep-alive session (API + Storage are each one host; pooling avoids a
+# TLS handshake per fixture).
+SESSION = requests.Session()
+SESSION.headers.update({"x-apisports-key": API_KEY})
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+        ),
+    ),
+)
+
+# Slug for filesystem/storage keys, computed once instead of per call site
+ROUND_SLUG = ROUND.replace(" ", "_").replace("-", "_")
+RUN_PREFIX = f"{SEASON}_{ROUND_SLUG}"
 
 ROOT = Path(__file__).resolve().parent
-RUN_DIR = ROOT / "raw-data" / "api-football" / f"{SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}"
+RUN_DIR = ROOT / "raw-data" / "api-football" / RUN_PREFIX
 FIX_DIR = RUN_DIR / "players_by_fixture"
 FIX_DIR.mkdir(parents=True, exist_ok=True)
 MANIFEST = RUN_DIR / "manifest.jsonl"
 
+# One gzipped NDJSON shard per round: the ETL reads it with a single GET
+# instead of listing + downloading N tiny per-fixture objects.
+SHARD = RUN_DIR / "players.ndjson.gz"
+_shard_lock = threading.Lock()
+
+def append_shard(fixture_id: int, j: dict) -> None:
+    line = orjson.dumps({"fixture_id": fixture_id, "payload": j}) + b"\n"
+    with _shard_lock:
+        with gzip.open(SHARD, "ab") as f:
+            f.write(line)
+
 def now_iso():
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
@@ -44,17 +95,24 @@ def _sb_obj_url(bucket: str, object_key: str) -> str:
     return f"{SUPABASE_URL}/storage/v1/object/{urllib.parse.quote(bucket)}/{urllib.parse.quote(object_key)}"
 
 def sb_upload_json(bucket: str, object_key: str, obj: dict, upsert: bool = True) -> None:
+    sb_upload_bytes(bucket, object_key, orjson.dumps(obj), upsert=upsert)
+
+async def sb_upload_async(http: "httpx.AsyncClient", bucket: str, object_key: str,
+                          content: bytes, content_type="application/json") -> None:
+    """Upload over the shared HTTP/2 client: concurrent fixture tasks
+    multiplex their storage POSTs on one TLS session instead of queueing
+    behind each other on an HTTP/1.1 keep-alive connection."""
     url = _sb_obj_url(bucket, object_key)
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE}",
-        "Content-Type": "application/json",
-        "x-upsert": "true" if upsert else "false",
-    }
-    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
-    resp = requests.post(url, headers=headers, data=data)
+    headers = {"Content-Type": content_type}
+    # same size cutoff + level as sb_upload_bytes; these per-fixture player
+    # payloads are the bulk of the bytes the gzip work was aimed at
+    if len(content) > 4096 and content_type != "application/gzip":
+        content = gzip.compress(content, compresslevel=4)
+        headers["Content-Encoding"] = "gzip"
+    resp = await http.post(url, headers=headers, content=content)
     if resp.status_code not in (200, 201):
         if resp.status_code in (400, 409):
-            resp = requests.put(url, headers=headers, data=data)
+            resp = await http.put(url, headers=headers, content=content)
         if resp.status_code not in (200, 201, 204):
             raise RuntimeError(f"Storage upload failed ({resp.status_code}): {resp.text[:300]}")
 
@@ -65,34 +123,74 @@ def sb_upload_bytes(bucket: str, object_key: str, content: bytes, content_type="
         "Content-Type": content_type,
         "x-upsert": "true" if upsert else "false",
     }
-    resp = requests.post(url, headers=headers, data=content)
+    # JSON payloads here are highly repetitive (~8x ratio); level 4 is a
+    # good speed/size point. Shard uploads arrive pre-gzipped, skip those.
+    if len(content) > 4096 and content_type != "application/gzip":
+        content = gzip.compress(content, compresslevel=4)
+        headers["Content-Encoding"] = "gzip"
+    resp = SESSION.post(url, headers=headers, data=content)
     if resp.status_code not in (200, 201):
         if resp.status_code in (400, 409):
-            resp = requests.put(url, headers=headers, data=content)
+            resp = SESSION.put(url, headers=headers, data=content)
         if resp.status_code not in (200, 201, 204):
             raise RuntimeError(f"Storage upload failed ({resp.status_code}): {resp.text[:300]}")
 
 # ---------- Local manifest helpers ----------
+# In-memory mirrors of the manifest: membership checks in the hot loop are
+# O(1) set/dict lookups instead of re-reading the file or stat()ing disk.
+DONE_OK: set = set()
+ATTEMPTS: dict = {}
+
 def load_done_map():
     done = {}
     if MANIFEST.exists():
-        with MANIFEST.open("r", encoding="utf-8") as f:
+        with MANIFEST.open("rb") as f:
             for line in f:
                 try:
-                    rec = json.loads(line)
+                    rec = orjson.loads(line)
                     done[rec["fixture_id"]] = rec
                 except Exception:
                     continue
+    for fid, rec in done.items():
+        if rec.get("status") == "ok":
+            DONE_OK.add(fid)
+        ATTEMPTS[fid] = rec.get("attempts", 0)
     return done
 
-def append_manifest(**rec):
-    line = json.dumps(rec, ensure_ascii=False) + "\n"
-    MANIFEST.open("a", encoding="utf-8").write(line)
-    # also sync manifest to Storage (append-like by re-uploading whole file)
+# Re-uploading the manifest after every fixture is O(N^2) bytes over a
+# round; checkpoint every K appends and once at exit instead. Local appends
+# are unchanged, so resume still works even if the last checkpoint is stale.
+MANIFEST_FLUSH_EVERY = int(os.getenv("MANIFEST_FLUSH_EVERY", 25))
+_manifest_lock = threading.Lock()
+_manifest_appends = 0
+_manifest_fh = None
+
+def _manifest_handle():
+    """Lazily open the manifest once in append mode; per-call open/close
+    was a syscall pair per fixture. Callers must hold _manifest_lock."""
+    global _manifest_fh
+    if _manifest_fh is None or _manifest_fh.closed:
+        _manifest_fh = MANIFEST.open("ab")
+    return _manifest_fh
+
+def _close_manifest():
+    with _manifest_lock:
+        if _manifest_fh is not None and not _manifest_fh.closed:
+            _manifest_fh.close()
+
+# LIFO: the handle is flushed/closed before the final manifest upload runs
+atexit.register(_close_manifest)
+
+def flush_manifest():
+    with _manifest_lock:
+        if _manifest_fh is not None and not _manifest_fh.closed:
+            _manifest_fh.flush()
+    if not MANIFEST.exists():
+        return
     try:
         sb_upload_bytes(
             SUPABASE_BUCKET,
-            f"{SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}/manifest.jsonl",
+            f"{RUN_PREFIX}/manifest.jsonl",
             MANIFEST.read_bytes(),
             content_type="text/plain; charset=utf-8",
             upsert=True,
@@ -100,10 +198,29 @@ def append_manifest(**rec):
     except Exception as e:
         print(f"⚠️ Failed to upload manifest: {e}")
 
+atexit.register(flush_manifest)
+
+def append_manifest(**rec):
+    global _manifest_appends
+    line = orjson.dumps(rec) + b"\n"
+    with _manifest_lock:
+        _manifest_handle().write(line)
+        _manifest_appends += 1
+        checkpoint = _manifest_appends % MANIFEST_FLUSH_EVERY == 0
+        # keep the in-memory mirrors current
+        fid = rec.get("fixture_id")
+        if fid is not None:
+            if rec.get("status") == "ok":
+                DONE_OK.add(fid)
+            ATTEMPTS[fid] = rec.get("attempts", ATTEMPTS.get(fid, 0))
+    if checkpoint:
+        flush_manifest()
+
 # ---------- HTTP helpers ----------
 def get_json(path, params=None):
     url = f"{BASE}{path}"
-    r = requests.get(url, headers=HEADERS, params=params or {})
+    # bounded connect/read: a hung socket costs 35s, not a stuck worker
+    r = SESSION.get(url, params=params or {}, timeout=(5, 30))
     print(f"GET {r.url} [{r.status_code}]")
     try:
         j = r.json()
@@ -111,20 +228,35 @@ def get_json(path, params=None):
         return r, None
     return r, j
 
-def sleep_for_rate_limit(last_ts):
-    if last_ts is None:
-        return time.time()
-    elapsed = time.time() - last_ts
-    if elapsed < MIN_INTERVAL_SECONDS:
-        time.sleep(MIN_INTERVAL_SECONDS - elapsed)
-    return time.time()
+class TokenBucket:
+    """Paces requests off time.monotonic() (immune to NTP clock jumps).
+
+    acquire() reserves the next slot under a lock, then sleeps outside it,
+    so response parsing/writes overlap the inter-request gap and multiple
+    threads can share one bucket."""
+
+    def __init__(self, min_interval: float):
+        self.interval = min_interval
+        self._next_ready = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_ready - now
+            self._next_ready = max(now, self._next_ready) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+BUCKET = TokenBucket(MIN_INTERVAL_SECONDS)
 
 # ===== 0) Status (optional) =====
 r, status = get_json("/status")
 if r.status_code == 200 and isinstance(status, dict):
-    (RUN_DIR / "status.json").write_text(json.dumps(status, indent=2), encoding="utf-8")
+    buf = orjson.dumps(status)
+    (RUN_DIR / "status.json").write_bytes(buf)
     try:
-        sb_upload_json(SUPABASE_BUCKET, f"{SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}/status.json", status)
+        sb_upload_bytes(SUPABASE_BUCKET, f"{RUN_PREFIX}/status.json", buf)
     except Exception as e:
         print(f"⚠️ Failed to upload status.json: {e}")
 else:
@@ -139,19 +271,27 @@ else:
     if r.status_code != 200 or not isinstance(fjson, dict):
         print(f"❌ fixtures fetch failed: {r.status_code} {getattr(r, 'text', '')[:200]}")
         sys.exit(1)
-    fixtures_path.write_text(json.dumps(fjson, indent=2), encoding="utf-8")
+    buf = orjson.dumps(fjson)
+    fixtures_path.write_bytes(buf)
     try:
-        sb_upload_json(SUPABASE_BUCKET, f"{SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}/fixtures.json", fjson)
+        sb_upload_bytes(SUPABASE_BUCKET, f"{RUN_PREFIX}/fixtures.json", buf)
     except Exception as e:
         print(f"⚠️ Failed to upload fixtures.json: {e}")
     fixtures = fjson.get("response", [])
 
 print(f"📈 Fixtures found: {len(fixtures)} for {SEASON} / '{ROUND}'")
 if not fixtures:
+    # same local-first treatment fixtures.json gets: a previous run's round
+    # list is good enough to diagnose a bad ROUND value without a request
+    rounds_path = RUN_DIR / "valid_rounds.json"
+    if rounds_path.exists():
+        print(f"ℹ️ Valid rounds already cached at {rounds_path}")
+        sys.exit(0)
     r, rounds = get_json("/fixtures/rounds", params={"league": LEAGUE_ID, "season": SEASON})
-    (RUN_DIR / "valid_rounds.json").write_text(json.dumps(rounds, indent=2), encoding="utf-8")
+    buf = orjson.dumps(rounds)
+    rounds_path.write_bytes(buf)
     try:
-        sb_upload_json(SUPABASE_BUCKET, f"{SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}/valid_rounds.json", rounds)
+        sb_upload_bytes(SUPABASE_BUCKET, f"{RUN_PREFIX}/valid_rounds.json", buf)
     except Exception as e:
         print(f"⚠️ Failed to upload valid_rounds.json: {e}")
     sys.exit(0)
@@ -160,61 +300,251 @@ if not fixtures:
 done_map = load_done_map()
 print(f"🔁 Already have manifest entries for {len(done_map)} fixtures")
 
-# ===== 3) Iterate fixtures with strict rate-limit =====
-last_request_ts = None
+# ===== 3) Fetch players per fixture =====
 ok_count, skip_count, err_count = 0, 0, 0
 
+# Figure out what still needs fetching (manifest 'ok' or local file = done).
+# One glob replaces a stat() per fixture; .tmp leftovers never match.
+existing_files = {p.name for p in FIX_DIR.glob("players_*.json")}
+pending = []  # (fixture_id, prior_attempts)
 for fx in fixtures:
     fixture_id = fx["fixture"]["id"]
-    out_path = FIX_DIR / f"players_{fixture_id}.json"
-    storage_key = f"{SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}/players_by_fixture/players_{fixture_id}.json"
-
-    prev = done_map.get(fixture_id)
-    if (prev and prev.get("status") == "ok") or out_path.exists():
+    if fixture_id in DONE_OK or f"players_{fixture_id}.json" in existing_files:
         skip_count += 1
         continue
+    pending.append((fixture_id, ATTEMPTS.get(fixture_id, 0)))
 
-    attempts = (prev or {}).get("attempts", 0)
 
-    while attempts < MAX_ATTEMPTS_PER_FIXTURE:
-        attempts += 1
-        last_request_ts = sleep_for_rate_limit(last_request_ts)
+def split_batch_response(j):
+    """Group a multi-fixture /fixtures/players response back into
+    per-fixture payloads. Returns None when blocks can't be attributed
+    (plan doesn't echo fixture ids), which callers treat as unsupported."""
+    by_fixture = {}
+    for blk in j.get("response") or []:
+        fid = (blk.get("fixture") or {}).get("id")
+        if fid is None:
+            return None
+        by_fixture.setdefault(fid, []).append(blk)
+    return by_fixture
 
-        r, j = get_json("/fixtures/players", params={"fixture": fixture_id})
 
-        if r.status_code == 429:
-            retry_after = r.headers.get("Retry-After")
-            wait = int(retry_after) if (retry_after and retry_after.isdigit()) else min(60, int(2 ** attempts * 2))
-            print(f"⏳ 429 rate limited. Waiting {wait}s…")
-            time.sleep(wait)
-            continue
+def probe_batch_support(ids):
+    """Some plans accept dash-separated fixture ids on /fixtures/players.
+    Probe once with two ids; anything short of attributable results for
+    both means we stay on the single-fixture path. Returns the probe's
+    per-fixture payloads on success (so they aren't re-fetched), else
+    None."""
+    if len(ids) < 2:
+        return None
+    BUCKET.acquire()  # the probe is a real API call; pace it like the rest
+    r, j = get_json("/fixtures/players", params={"fixture": f"{ids[0]}-{ids[1]}"})
+    if r.status_code != 200 or not isinstance(j, dict):
+        return None
+    by_fixture = split_batch_response(j)
+    if by_fixture is None or len(by_fixture) < 2:
+        return None
+    return by_fixture
 
-        if r.status_code != 200 or not isinstance(j, dict):
-            msg = f"http {r.status_code}: {getattr(r, 'text', '')[:200]}"
-            append_manifest(
-                season=SEASON, round=ROUND, fixture_id=fixture_id,
-                status="error", attempts=attempts, message=msg, updated_at=now_iso()
-            )
-            print(f"❌ Fixture {fixture_id} attempt {attempts} failed: {msg}")
-        else:
-            # Write locally (optional) and upload immediately to Supabase
-            out_path.write_text(json.dumps(j, indent=2), encoding="utf-8")
-            try:
-                sb_upload_json(SUPABASE_BUCKET, storage_key, j)
-            except Exception as e:
-                print(f"⚠️ Failed to upload {storage_key}: {e}")
-            append_manifest(
-                season=SEASON, round=ROUND, fixture_id=fixture_id,
-                status="ok", attempts=attempts, message=f"saved:{out_path.name}", updated_at=now_iso()
-            )
+
+def handle_players_payload(fixture_id, attempts, status_code, j):
+    """Persist one fixture's players payload (or record the failure).
+
+    Returns True when the payload was saved."""
+    out_path = FIX_DIR / f"players_{fixture_id}.json"
+    storage_key = f"{RUN_PREFIX}/players_by_fixture/players_{fixture_id}.json"
+    if status_code != 200 or not isinstance(j, dict):
+        msg = f"http {status_code}"
+        append_manifest(
+            season=SEASON, round=ROUND, fixture_id=fixture_id,
+            status="error", attempts=attempts, message=msg, updated_at=now_iso()
+        )
+        print(f"❌ Fixture {fixture_id} attempt {attempts} failed: {msg}")
+        return False
+    # Write locally (optional) and upload immediately to Supabase.
+    # tmp + os.replace so a crash can't leave a truncated players file that
+    # the resume scan would mistake for a completed fixture.
+    buf = orjson.dumps(j)  # one serialization feeds both disk and storage
+    tmp = out_path.with_suffix(".tmp")
+    tmp.write_bytes(buf)
+    os.replace(tmp, out_path)
+    append_shard(fixture_id, j)
+    try:
+        sb_upload_bytes(SUPABASE_BUCKET, storage_key, buf)
+    except Exception as e:
+        print(f"⚠️ Failed to upload {storage_key}: {e}")
+    append_manifest(
+        season=SEASON, round=ROUND, fixture_id=fixture_id,
+        status="ok", attempts=attempts, message=f"saved:{out_path.name}", updated_at=now_iso()
+    )
+    print(f"✅ Saved {out_path.name} and uploaded to storage: {storage_key}")
+    return True
+
+
+async def fetch_players_async(pending):
+    """Fan out /fixtures/players over aiohttp with bounded concurrency.
+
+    A semaphore caps in-flight requests and an AsyncLimiter keeps us under
+    the per-minute budget implied by MIN_INTERVAL_SECONDS; 429s honor
+    Retry-After with exponential backoff up to MAX_ATTEMPTS_PER_FIXTURE.
+    """
+    ok = err = 0
+    rpm = max(1, int(60 / MIN_INTERVAL_SECONDS))
+    limiter = AsyncLimiter(rpm, 60)
+    sem = asyncio.Semaphore(CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit_per_host=16)
+
+    sb_http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=10),
+        headers={"Authorization": f"Bearer {SUPABASE_SERVICE_ROLE}", "x-upsert": "true"},
+    )
+    async with sb_http, aiohttp.ClientSession(connector=connector, headers={"x-apisports-key": API_KEY}) as http:
+
+        async def fetch_one(fixture_id, attempts):
+            nonlocal ok, err
+            while attempts < MAX_ATTEMPTS_PER_FIXTURE:
+                attempts += 1
+                async with sem, limiter:
+                    async with http.get(f"{BASE}/fixtures/players", params={"fixture": fixture_id}) as resp:
+                        status = resp.status
+                        retry_after = resp.headers.get("Retry-After")
+                        try:
+                            j = await resp.json(content_type=None)
+                        except Exception:
+                            j = None
+
+                if status == 429:
+                    # jittered backoff so concurrent workers don't retry in
+                    # lockstep; Retry-After is honored as the floor
+                    floor = int(retry_after) if (retry_after and retry_after.isdigit()) else 0
+                    wait = max(floor, random.uniform(0.5, 1.5) * min(60, 2 ** attempts))
+                    print(f"⏳ 429 rate limited on fixture {fixture_id}. Waiting {wait:.1f}s…")
+                    await asyncio.sleep(wait)
+                    continue
+
+                if status == 200 and isinstance(j, dict):
+                    out_path = FIX_DIR / f"players_{fixture_id}.json"
+                    buf = orjson.dumps(j)  # serialized once for disk + storage
+                    tmp = out_path.with_suffix(".tmp")
+                    async with aiofiles.open(tmp, "wb") as f:
+                        await f.write(buf)
+                    os.replace(tmp, out_path)
+                    await asyncio.to_thread(append_shard, fixture_id, j)
+                    # upload + manifest append reuse the sync helpers off-loop
+                    storage_key = f"{RUN_PREFIX}/players_by_fixture/players_{fixture_id}.json"
+                    try:
+                        await sb_upload_async(sb_http, SUPABASE_BUCKET, storage_key, buf)
+                    except Exception as e:
+                        print(f"⚠️ Failed to upload {storage_key}: {e}")
+                    await asyncio.to_thread(
+                        append_manifest,
+                        season=SEASON, round=ROUND, fixture_id=fixture_id,
+                        status="ok", attempts=attempts, message=f"saved:{out_path.name}", updated_at=now_iso(),
+                    )
+                    ok += 1
+                    print(f"✅ Saved {out_path.name} and uploaded to storage: {storage_key}")
+                    return
+
+                msg = f"http {status}"
+                await asyncio.to_thread(
+                    append_manifest,
+                    season=SEASON, round=ROUND, fixture_id=fixture_id,
+                    status="error", attempts=attempts, message=msg, updated_at=now_iso(),
+                )
+                print(f"❌ Fixture {fixture_id} attempt {attempts} failed: {msg}")
+
+            err += 1
+            print(f"⚠️ Gave up on fixture {fixture_id} after {attempts} attempts")
+
+        await asyncio.gather(*(fetch_one(fid, att) for fid, att in pending))
+
+    return ok, err
+
+
+# If the plan supports multi-fixture requests, drain pending in groups of
+# FIXTURE_BATCH first — each group costs one rate-limit token instead of N.
+if len(pending) > 1 and (probed := probe_batch_support([fid for fid, _ in pending])) is not None:
+    print(f"📦 Plan supports batched /fixtures/players; fetching in groups of {FIXTURE_BATCH}")
+    remaining = []
+    # the probe already fetched its two fixtures — persist those payloads
+    # instead of paying for them again in the group loop
+    rest = []
+    for fid, att in pending:
+        blocks = probed.get(fid)
+        if blocks is None:
+            rest.append((fid, att))
+        elif handle_players_payload(fid, att + 1, 200, {"response": blocks}):
             ok_count += 1
-            print(f"✅ Saved {out_path.name} and uploaded to storage: {storage_key}")
-            break
+        else:
+            remaining.append((fid, att + 1))
+    for i in range(0, len(rest), FIXTURE_BATCH):
+        group = rest[i:i + FIXTURE_BATCH]
+        BUCKET.acquire()
+        r, j = get_json(
+            "/fixtures/players",
+            params={"fixture": "-".join(str(fid) for fid, _ in group)},
+        )
+        by_fixture = split_batch_response(j) if (r.status_code == 200 and isinstance(j, dict)) else None
+        if by_fixture is None:
+            remaining.extend(group)
+            continue
+        for fid, att in group:
+            blocks = by_fixture.get(fid)
+            if blocks is None:
+                remaining.append((fid, att))
+                continue
+            if handle_players_payload(fid, att + 1, 200, {"response": blocks}):
+                ok_count += 1
+            else:
+                remaining.append((fid, att + 1))
+    pending = remaining
+
+if ASYNC_MODE:
+    # accumulate: ok_count already holds successes from the batch loop above
+    a_ok, a_err = asyncio.run(fetch_players_async(pending))
+    ok_count += a_ok
+    err_count += a_err
+else:
+    # Serial fallback with strict rate-limit
+    for fixture_id, attempts in pending:
+        out_path = FIX_DIR / f"players_{fixture_id}.json"
+        saved = False
+        while attempts < MAX_ATTEMPTS_PER_FIXTURE:
+            attempts += 1
+            BUCKET.acquire()
+
+            r, j = get_json("/fixtures/players", params={"fixture": fixture_id})
 
-    if attempts >= MAX_ATTEMPTS_PER_FIXTURE and (not out_path.exists()):
-        err_count += 1
-        print(f"⚠️ Gave up on fixture {fixture_id} after {attempts} attempts")
+            if r.status_code == 429:
+                retry_after = r.headers.get("Retry-After")
+                floor = int(retry_after) if (retry_after and retry_after.isdigit()) else 0
+                wait = max(floor, random.uniform(0.5, 1.5) * min(60, 2 ** attempts))
+                print(f"⏳ 429 rate limited. Waiting {wait:.1f}s…")
+                time.sleep(wait)
+                continue
+
+            if handle_players_payload(fixture_id, attempts, r.status_code, j):
+                ok_count += 1
+                saved = True
+                break
+
+        if not saved and not out_path.exists():
+            err_count += 1
+            print(f"⚠️ Gave up on fixture {fixture_id} after {attempts} attempts")
+
+# ===== 4) Upload the round shard (one object instead of N) =====
+if SHARD.exists():
+    try:
+        sb_upload_bytes(
+            SUPABASE_BUCKET,
+            f"{RUN_PREFIX}/players.ndjson.gz",
+            SHARD.read_bytes(),
+            content_type="application/gzip",
+        )
+        print(f"📦 Uploaded shard: {SHARD.name}")
+    except Exception as e:
+        print(f"⚠️ Failed to upload {SHARD.name}: {e}")
 
 print(f"🏁 Done. ok={ok_count} | skipped={skip_count} | errors={err_count}")
 print(f"🧾 Manifest: {MANIFEST}")
-print(f"📦 Storage prefix: {SEASON}_{ROUND.replace(' ', '_').replace('-', '_')}/")
+print(f"📦 Storage prefix: {RUN_PREFIX}/")
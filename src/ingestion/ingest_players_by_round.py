@@ -1,13 +1,20 @@
 import os
 import time
+import random
 import argparse
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from ._cache import disk_cached
+
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 
@@ -30,33 +37,103 @@ HEADERS = (
     {"x-apisports-key": API_KEY}
 )
 
+# Keep-alive session: one TLS handshake per host instead of one per fixture.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=["GET", "POST", "PUT"],
+            respect_retry_after_header=True,
+        ),
+    ),
+)
+
+# ---- Rate limiting ----
+MIN_INTERVAL_SECONDS = float(os.getenv("MIN_INTERVAL_SECONDS", "0.25"))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))
+
+class TokenBucket:
+    """Thread-safe request pacing off time.monotonic(): workers reserve the
+    next free slot under a lock and sleep outside it, so N threads stay in
+    flight while the aggregate rate honors the API cap."""
+
+    def __init__(self, min_interval: float):
+        self.interval = min_interval
+        self._next_ready = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_ready - now
+            self._next_ready = max(now, self._next_ready) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+BUCKET = TokenBucket(MIN_INTERVAL_SECONDS)
+
 def apifootball_get(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
     url = f"{API_BASE}/{path.lstrip('/')}"
     for attempt in range(5):
-        r = requests.get(url, headers=HEADERS, params=params, timeout=60)
+        BUCKET.acquire()
+        try:
+            # small connect + bounded read; one slow fixture shouldn't
+            # stall a worker for the full old 60s
+            r = SESSION.get(url, params=params, timeout=(5, 30))
+        except (requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout) as e:
+            wait = random.uniform(0, 2 ** attempt * 0.1) + 2 ** attempt * 0.1
+            logging.warning("API timeout (%s). Retrying in %.2fs… (%s)", type(e).__name__, wait, url)
+            time.sleep(wait)
+            continue
         if r.status_code == 200:
             return r.json()
         if r.status_code in (429, 502, 503, 504):
-            wait = 2 ** attempt
-            logging.warning("API %s. Retrying in %ss… (%s)", r.status_code, wait, url)
+            # small base with decorrelated jitter: parallel workers back off
+            # at different instants instead of re-triggering the 429 together
+            wait = random.uniform(0, 2 ** attempt * 0.1) + 2 ** attempt * 0.1
+            logging.warning("API %s. Retrying in %.2fs… (%s)", r.status_code, wait, url)
             time.sleep(wait)
             continue
         r.raise_for_status()
     raise RuntimeError(f"GET {url} failed after retries")
 
 # ---- Supabase ----
+UPSERT_CHUNK = int(os.getenv("UPSERT_CHUNK", "500"))
+_supa_client: Client = None
+
 def supa() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    # create_client builds a fresh HTTP pool + auth state each call; cache it
+    global _supa_client
+    if _supa_client is None:
+        _supa_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supa_client
 
 # ---- API helpers ----
-def list_rounds(league_id: int, season: int, current_only: bool=False) -> List[str]:
-    params = {"league": league_id, "season": season}
-    if current_only:
-        params["current"] = "true"
-    d = apifootball_get("/fixtures/rounds", params)
+# Past-round metadata is immutable, so the full round list memoizes for a
+# day; the "current" round moves, so it only gets a minute.
+@disk_cached(ttl=86400)
+def _all_rounds(league_id: int, season: int) -> List[str]:
+    d = apifootball_get("/fixtures/rounds", {"league": league_id, "season": season})
+    rounds = d.get("response", []) or []
+    return [rounds] if isinstance(rounds, str) else rounds
+
+@disk_cached(ttl=60)
+def _current_rounds(league_id: int, season: int) -> List[str]:
+    d = apifootball_get("/fixtures/rounds", {"league": league_id, "season": season, "current": "true"})
     rounds = d.get("response", []) or []
     return [rounds] if isinstance(rounds, str) else rounds
 
+def list_rounds(league_id: int, season: int, current_only: bool=False) -> List[str]:
+    return _current_rounds(league_id, season) if current_only else _all_rounds(league_id, season)
+
+@disk_cached(ttl=86400)
 def fixtures_for_round(league_id: int, season: int, round_name: str) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
     page = 1
@@ -66,8 +143,7 @@ def fixtures_for_round(league_id: int, season: int, round_name: str) -> List[Dic
         paging = d.get("paging", {}) or {}
         if paging.get("current", 1) >= paging.get("total", 1):
             break
-        page += 1
-        time.sleep(0.3)
+        page += 1  # pacing handled by the token bucket in apifootball_get
     return out
 
 def players_for_fixture(fixture_id: int) -> List[Dict[str, Any]]:
@@ -75,26 +151,34 @@ def players_for_fixture(fixture_id: int) -> List[Dict[str, Any]]:
     return d.get("response", []) or []
 
 # ---- Transform ----
+# shared read-only fallback: every `.get(x, {})` used to evaluate a fresh
+# dict literal per call, thousands of allocations per round
+_EMPTY: Dict[str, Any] = {}
+
 def to_player_rows(fixture_id: int, payload: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
+    # the row count is known up front, so allocate once instead of letting
+    # append-driven reallocs copy the reference array as it grows
+    total = sum(len(tb.get("players") or []) for tb in payload)
+    rows: List[Dict[str, Any]] = [None] * total
+    n = 0
     for team_block in payload:
-        team = team_block.get("team", {}) or {}
+        team = team_block.get("team") or _EMPTY
         team_id = team.get("id")
-        for p in team_block.get("players", []) or []:
-            player = p.get("player", {}) or {}
-            stats_list = p.get("statistics") or []
-            stats = stats_list[0] if stats_list else {}
+        for p in team_block.get("players") or ():
+            player = p.get("player") or _EMPTY
+            stats_list = p.get("statistics")
+            stats = stats_list[0] if stats_list else _EMPTY
 
-            games = stats.get("games", {}) or {}
-            shots = stats.get("shots", {}) or {}
-            goals = stats.get("goals", {}) or {}
-            cards = stats.get("cards", {}) or {}
-            pen   = stats.get("penalty", {}) or {}
+            games = stats.get("games") or _EMPTY
+            shots = stats.get("shots") or _EMPTY
+            goals = stats.get("goals") or _EMPTY
+            cards = stats.get("cards") or _EMPTY
+            pen   = stats.get("penalty") or _EMPTY
 
             # Saves sometimes live under goalkeeper or under goals
-            saves = (stats.get("goalkeeper", {}) or {}).get("saves")
+            saves = (stats.get("goalkeeper") or _EMPTY).get("saves")
             if saves is None:
-                saves = (stats.get("goals", {}) or {}).get("saves")
+                saves = goals.get("saves")
 
             row = {
                 "fixture_id":        fixture_id,
@@ -115,10 +199,12 @@ def to_player_rows(fixture_id: int, payload: List[Dict[str, Any]]) -> List[Dict[
                 "penalties_won":     pen.get("won"),
                 "penalties_scored":  pen.get("scored"),
                 "penalties_missed":  pen.get("missed"),
-                "raw_json":          p
+                "raw_json":          p,
             }
             if row["player_id"] is not None:
-                rows.append(row)
+                rows[n] = row
+                n += 1
+    del rows[n:]  # trim slots skipped for null player ids
     return rows
 
 # ---- Upsert ----
@@ -126,7 +212,9 @@ def upsert_players(rows: List[Dict[str, Any]]) -> int:
     if not rows:
         return 0
     sb = supa()
-    sb.table("fixture_player_stats").upsert(rows).execute()
+    # chunked: one request per UPSERT_CHUNK rows instead of one per fixture
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        sb.table("fixture_player_stats").upsert(rows[i:i + UPSERT_CHUNK]).execute()
     return len(rows)
 
 # ---- Round helpers / selection ----
@@ -172,17 +260,21 @@ def resolve_rounds(league: int, season: int, round_arg: str) -> List[str]:
 # ---- Orchestration ----
 def ingest_round(league: int, season: int, round_name: str) -> int:
     fixtures = fixtures_for_round(league, season, round_name)
-    total = 0
-    for f in fixtures:
-        fx_id = (f.get("fixture") or {}).get("id")
-        if not fx_id:
-            continue
-        payload = players_for_fixture(fx_id)
-        rows = to_player_rows(fx_id, payload)
-        n = upsert_players(rows)
-        total += n
-        logging.info("Fixture %s → %d player rows", fx_id, n)
-        time.sleep(0.25)
+    fixture_ids = [fx_id for f in fixtures if (fx_id := (f.get("fixture") or {}).get("id"))]
+
+    def fetch_rows(fx_id: int) -> List[Dict[str, Any]]:
+        rows = to_player_rows(fx_id, players_for_fixture(fx_id))
+        logging.info("Fixture %s → %d player rows", fx_id, len(rows))
+        return rows
+
+    # Fixtures are independent and latency-bound; the shared token bucket
+    # inside apifootball_get keeps the aggregate request rate under the cap.
+    # Workers only fetch+flatten; the round is upserted once, in chunks.
+    all_rows: List[Dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        for rows in ex.map(fetch_rows, fixture_ids):
+            all_rows.extend(rows)
+    total = upsert_players(all_rows)
     logging.info("Round '%s' complete → %d player rows", round_name, total)
     return total
 
@@ -1,11 +1,36 @@
 #!/usr/bin/env python3
-import os, sys, time, argparse, re
+import os, sys, time, argparse, re, threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as papq
+
+from ._cache import disk_cached
 
 API_BASE = "https://v3.football.api-sports.io"
 
+# Keep-alive pooled session shared by every request in the run
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=["GET", "POST", "PUT"],
+            respect_retry_after_header=True,
+        ),
+    ),
+)
+
 def headers() -> Dict[str, str]:
     api_key = os.getenv("API_FOOTBALL_KEY")
     rapidapi_host = os.getenv("RAPIDAPI_HOST", "").strip()
@@ -15,16 +40,45 @@ def headers() -> Dict[str, str]:
     return ({"X-RapidAPI-Key": api_key, "X-RapidAPI-Host": rapidapi_host}
             if rapidapi_host else {"x-apisports-key": api_key})
 
+# resolved once; they ride along on the session instead of per-call kwargs
+SESSION.headers.update(headers())
+
+MIN_INTERVAL_SECONDS = float(os.getenv("MIN_INTERVAL_SECONDS", "0.25"))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))
+
+class TokenBucket:
+    """Thread-safe pacing off time.monotonic(); shared by all workers so
+    the aggregate request rate stays under the API's per-minute cap."""
+
+    def __init__(self, min_interval: float):
+        self.interval = min_interval
+        self._next_ready = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_ready - now
+            self._next_ready = max(now, self._next_ready) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+BUCKET = TokenBucket(MIN_INTERVAL_SECONDS)
+
 def get_json(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
-    r = requests.get(f"{API_BASE}/{path.lstrip('/')}", headers=headers(), params=params, timeout=60)
+    BUCKET.acquire()
+    r = SESSION.get(f"{API_BASE}/{path.lstrip('/')}", params=params, timeout=(5, 30))
     r.raise_for_status()
     return r.json()
 
+# metadata for past rounds is immutable; share one cached copy across runs
+@disk_cached(ttl=86400)
 def list_rounds(league: int, season: int) -> List[str]:
     d = get_json("/fixtures/rounds", {"league": league, "season": season})
     rounds = d.get("response", []) or []
     return [rounds] if isinstance(rounds, str) else rounds
 
+@disk_cached(ttl=86400)
 def fixtures_for_round(league: int, season: int, round_name: str) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
     page = 1
@@ -34,64 +88,109 @@ def fixtures_for_round(league: int, season: int, round_name: str) -> List[Dict[s
         paging = d.get("paging", {}) or {}
         if paging.get("current", 1) >= paging.get("total", 1):
             break
-        page += 1
-        time.sleep(0.15)
+        page += 1  # pacing handled by the token bucket in get_json
     return out
 
 def players_for_fixture(fixture_id: int) -> List[Dict[str, Any]]:
     d = get_json("/fixtures/players", {"fixture": fixture_id})
     return d.get("response", []) or []
 
+# compiled once at import; avoids re-keying re's internal cache per call
+_ROUND_NUM_RE = re.compile(r"(\d+)$")
+_NON_ALNUM_RE = re.compile(r"[^A-Za-z0-9]+")
+
 def round_number(round_name: str) -> str:
     """Extract '1' from 'Regular Season - 1' etc. Fallback to a safe slug."""
-    m = re.search(r"(\d+)$", round_name or "")
-    return m.group(1) if m else re.sub(r"[^A-Za-z0-9]+", "", (round_name or "round"))
+    m = _ROUND_NUM_RE.search(round_name or "")
+    return m.group(1) if m else _NON_ALNUM_RE.sub("", (round_name or "round"))
+
+# fixed output schema; json_normalize column names are renamed into this
+PLAYER_COLS = [
+    "fixture_id", "team_id", "team_name", "player_id", "player_name",
+    "position", "minutes", "rating", "shots_total", "shots_on",
+    "goals", "assists", "conceded", "yellow", "red",
+    "penalties_won", "penalties_scored", "penalties_missed",
+]
+
+# Nullable widths sized to football stats; None-heavy columns otherwise
+# land as object dtype, which bloats memory and slows the CSV write.
+PLAYER_DTYPES = {
+    "minutes": "Int16",
+    "shots_total": "Int16",
+    "shots_on": "Int16",
+    "goals": "Int16",
+    "assists": "Int16",
+    "conceded": "Int16",
+    "yellow": "Int8",
+    "red": "Int8",
+    "penalties_won": "Int8",
+    "penalties_scored": "Int8",
+    "penalties_missed": "Int8",
+    "rating": "float32",
+}
+
+_NORMALIZE_RENAMES = {
+    "team.id": "team_id",
+    "team.name": "team_name",
+    "player.id": "player_id",
+    "player.name": "player_name",
+    "statistics.games.position": "position",
+    "statistics.games.minutes": "minutes",
+    "statistics.games.rating": "rating",
+    "statistics.shots.total": "shots_total",
+    "statistics.shots.on": "shots_on",
+    "statistics.goals.total": "goals",
+    "statistics.goals.assists": "assists",
+    "statistics.goals.conceded": "conceded",
+    "statistics.cards.yellow": "yellow",
+    "statistics.cards.red": "red",
+    "statistics.penalty.won": "penalties_won",
+    "statistics.penalty.scored": "penalties_scored",
+    "statistics.penalty.missed": "penalties_missed",
+}
+
+def flatten_players(fixture_id: int, payload: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Flatten one fixture's /fixtures/players payload into a DataFrame.
 
-def flatten_players(fixture_id: int, payload: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
+    json_normalize walks the nested dicts in pandas instead of ~18 chained
+    .get() calls per player in Python.
+    """
+    # record_path raises KeyError on a team block without a players key;
+    # drop those up front like the old .get("players") loop tolerated
+    payload = [team for team in payload if team.get("players")]
+    if not payload:
+        return pd.DataFrame(columns=PLAYER_COLS)
+    # statistics is a single-element list; collapse it in place so the
+    # stat columns normalize to statistics.games.position etc.
     for team in payload:
-        t = team.get("team", {}) or {}
         for p in team.get("players", []) or []:
-            player = p.get("player", {}) or {}
-            stats = (p.get("statistics") or [{}])[0]
-            games = stats.get("games", {}) or {}
-            shots = stats.get("shots", {}) or {}
-            goals = stats.get("goals", {}) or {}
-            cards = stats.get("cards", {}) or {}
-            pen   = stats.get("penalty", {}) or {}
-            rows.append({
-                "fixture_id": fixture_id,
-                "team_id": t.get("id"),
-                "team_name": t.get("name"),
-                "player_id": player.get("id"),
-                "player_name": player.get("name"),
-                "position": games.get("position"),
-                "minutes": games.get("minutes"),
-                "rating": games.get("rating"),
-                "shots_total": shots.get("total"),
-                "shots_on": shots.get("on"),
-                "goals": goals.get("total"),
-                "assists": goals.get("assists"),
-                "conceded": goals.get("conceded"),
-                "yellow": cards.get("yellow"),
-                "red": cards.get("red"),
-                "penalties_won": pen.get("won"),
-                "penalties_scored": pen.get("scored"),
-                "penalties_missed": pen.get("missed"),
-            })
-    return rows
+            stats = p.get("statistics")
+            if isinstance(stats, list):
+                p["statistics"] = stats[0] if stats else {}
+    df = pd.json_normalize(
+        payload,
+        record_path=["players"],
+        meta=[["team", "id"], ["team", "name"]],
+    )
+    df = df.rename(columns=_NORMALIZE_RENAMES)
+    df["fixture_id"] = fixture_id
+    # reindex drops the unused stat columns and fills any the API omitted
+    return df.reindex(columns=PLAYER_COLS)
 
 def df_for_round(league: int, season: int, round_name: str) -> pd.DataFrame:
     fixtures = fixtures_for_round(league, season, round_name)
-    rows: List[Dict[str, Any]] = []
-    for f in fixtures:
-        fx_id = (f.get("fixture") or {}).get("id")
-        if not fx_id:
-            continue
-        rows.extend(flatten_players(fx_id, players_for_fixture(fx_id)))
-        time.sleep(0.1)
-    df = pd.DataFrame(rows)
+    fixture_ids = [fx_id for f in fixtures if (fx_id := (f.get("fixture") or {}).get("id"))]
+    frames: List[pd.DataFrame] = []
+    # Per-fixture fetches overlap in a small pool; the shared bucket keeps
+    # the overall request rate legal.
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        for fx_id, payload in zip(fixture_ids, ex.map(players_for_fixture, fixture_ids)):
+            frames.append(flatten_players(fx_id, payload))
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PLAYER_COLS)
     if not df.empty:
+        # ratings arrive as strings; coerce before the float32 cast
+        df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
+        df = df.astype(PLAYER_DTYPES)
         df.insert(0, "round", round_name)
         df.insert(0, "season", season)
     return df
@@ -120,7 +219,11 @@ def main():
         df = df_for_round(args.league, args.season, r)
         rn = round_number(r)
         out_path = os.path.join(args.outdir, f"playerScores{args.season}round{rn}.csv")
-        df.to_csv(out_path, index=False)
+        # Arrow's threaded CSV writer beats DataFrame.to_csv on wide frames;
+        # the parquet twin is what downstream analytics should read.
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pacsv.write_csv(table, out_path)
+        papq.write_table(table, os.path.splitext(out_path)[0] + ".parquet")
         print(f"Wrote {out_path} (rows={len(df)})")
 
 if __name__ == "__main__":
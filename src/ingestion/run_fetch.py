@@ -1,42 +1,51 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
 from .api_football import paged_get
 from ..storage.supabase_client import upsert
 
-# Minimal normalization helper
-def pick(d, path, default=None):
-    cur = d
-    for p in path.split("."):
-        if not isinstance(cur, dict) or p not in cur:
-            return default
-        cur = cur[p]
-    return cur
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+
+# Minimal normalization: direct .get chains instead of a dotted-path
+# walker — the old pick() split the path string and looped per field,
+# ~7 Python-level traversals per event.
+def event_row(e):
+    fixture = e.get("fixture") or {}
+    team = e.get("team") or {}
+    player = e.get("player") or {}
+    t = e.get("time") or {}
+    return {
+        "event_id": e.get("id"),
+        "fixture_id": fixture.get("id"),
+        "team_id": team.get("id"),
+        "player_id": player.get("id"),
+        "player_name": player.get("name"),
+        "type": e.get("type"),
+        "detail": e.get("detail"),
+        "minute": t.get("elapsed", 0),
+    }
 
 def main():
     league = int(os.getenv("LEAGUE_ID", "39"))     # EPL by default
     season = int(os.getenv("SEASON", "2023"))
 
-    # 1) Get recent fixtures for the season (limit keeps first run small)
-    fixtures = []
-    for f in paged_get("fixtures", {"league": league, "season": season}):
-        fixtures.append(f)
-        if len(fixtures) >= 10:     # keep the first manual run light
-            break
+    # 1) Get recent fixtures for the season; islice caps the iteration at
+    # the C level and keeps the first manual run light
+    fixtures = list(islice(paged_get("fixtures", {"league": league, "season": season}), 10))
+
+    # 2) For each fixture, fetch events and normalize. The per-fixture
+    # calls are latency-bound and independent, so they overlap in a small
+    # pool; the shared limiter inside paged_get keeps the aggregate rate
+    # legal and the shared session keeps connections warm.
+    def _events_for(fid):
+        return [event_row(e) for e in paged_get("fixtures/events", {"fixture": fid})]
 
-    # 2) For each fixture, fetch events and normalize
+    fids = [(fx.get("fixture") or {}).get("id") for fx in fixtures]
     rows = []
-    for fx in fixtures:
-        fid = pick(fx, "fixture.id")
-        for e in paged_get("fixtures/events", {"fixture": fid}):
-            rows.append({
-                "event_id": pick(e, "id"),
-                "fixture_id": pick(e, "fixture.id"),
-                "team_id": pick(e, "team.id"),
-                "player_id": pick(e, "player.id"),
-                "player_name": pick(e, "player.name"),
-                "type": pick(e, "type"),
-                "detail": pick(e, "detail"),
-                "minute": pick(e, "time.elapsed", 0),
-            })
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        for batch in ex.map(_events_for, fids):
+            rows.extend(batch)
 
     # 3) Write to Supabase
     upsert("fpl_events", rows, pk="event_id")
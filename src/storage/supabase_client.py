@@ -1,13 +1,24 @@
 import os
+from functools import lru_cache
+
 from supabase import create_client, Client
 
+@lru_cache(maxsize=1)
 def supa() -> Client:
+    # memoized: create_client rebuilds the PostgREST HTTP client (and its
+    # connection pool) each call, so per-upsert construction wasted a TLS
+    # handshake; caching keeps the pool warm across batches
     url = os.environ["SUPABASE_URL"]
     key = os.environ["SUPABASE_SERVICE_ROLE"]
     return create_client(url, key)
 
+CHUNK = int(os.getenv("SUPABASE_CHUNK", "500"))
+
 def upsert(table, rows, pk="event_id"):
     if not rows:
         return
     client = supa()
-    client.table(table).upsert(rows, on_conflict=pk).execute()
+    # chunked: one giant POST risks statement timeouts / 413s server-side
+    # and a huge client-side JSON serialization
+    for i in range(0, len(rows), CHUNK):
+        client.table(table).upsert(rows[i:i + CHUNK], on_conflict=pk).execute()